@@ -1,4 +1,5 @@
 import collections
+import concurrent.futures
 import itertools
 import json
 import logging
@@ -7,21 +8,49 @@ import os.path as osp
 import tempfile
 import warnings
 from collections import OrderedDict
-from typing import Any, Callable, List, Mapping, Optional, Sequence, Set
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Set
 
 import pandas as pd
 from sacred.observers import FileStorageObserver
 
 import imitation.util.sacred as sacred_util
 from imitation.scripts.config.analyze import analysis_ex
-from imitation.util.sacred import dict_get_nested as get
+
+
+def _path_getter(*keys: str) -> Callable[[Any], Any]:
+    """Builds a function that looks up nested `keys` in a dict.
+
+    The returned function is equivalent to `dict_get_nested(d, ".".join(keys))`,
+    returning None if any key is missing, but avoids re-splitting the dotted key on
+    every call.
+    """
+
+    def getter(d: Any) -> Any:
+        try:
+            for key in keys:
+                d = d[key]
+        except (KeyError, TypeError):
+            return None
+        return d
+
+    return getter
+
+
+# Accessors for fields of `SacredDicts.run` and `SacredDicts.config`.
+_run_status = _path_getter("status")
+_run_exp_name = _path_getter("experiment", "name")
+_run_imit_stats = _path_getter("result", "imit_stats")
+_run_expert_stats = _path_getter("result", "expert_stats")
+_config_env_name = _path_getter("env_name")
+_config_n_expert_demos = _path_getter("n_expert_demos")
+_config_algorithm = _path_getter("algorithm")
 
 
 @analysis_ex.capture
-def _gather_sacred_dicts(
+def _iter_sacred_dicts(
     source_dirs: Sequence[str], run_name: str, env_name: str, skip_failed_runs: bool
-) -> List[sacred_util.SacredDicts]:
-    """Helper function for parsing and selecting Sacred experiment JSON files.
+) -> Iterator[sacred_util.SacredDicts]:
+    """Helper function for lazily parsing and selecting Sacred experiment JSON files.
 
     Args:
         source_dirs: A directory containing Sacred FileObserver subdirectories
@@ -34,38 +63,104 @@ def _gather_sacred_dicts(
         skip_failed_runs: If True, then filter out runs where the status is FAILED.
             (Captured argument)
 
-    Returns:
-        A list of `SacredDicts` corresponding to the selected Sacred directories.
+    Yields:
+        `SacredDicts` corresponding to the selected Sacred directories.
     """
     # e.g. chain.from_iterable([["pathone", "pathtwo"], [], ["paththree"]]) =>
     # ("pathone", "pathtwo", "paththree")
     sacred_dirs = itertools.chain.from_iterable(
         sacred_util.filter_subdirs(source_dir) for source_dir in source_dirs
     )
-    sacred_dicts = []
 
-    for sacred_dir in sacred_dirs:
-        try:
-            sacred_dicts.append(sacred_util.SacredDicts.load_from_dir(sacred_dir))
-        except json.JSONDecodeError:
-            warnings.warn(f"Invalid JSON file in {sacred_dir}", RuntimeWarning)
+    # Loading is dominated by file reads, so overlap them across threads. At most
+    # `max_in_flight` loads are pending at once, so memory stays bounded however many
+    # directories there are. Results are consumed in submission order to keep the
+    # output deterministic.
+    max_workers = os.cpu_count() or 1
+    max_in_flight = 2 * max_workers
+    load_fn = sacred_util.SacredDicts.load_from_dir
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    futures = collections.deque()
+    invalid_dirs = []
+    try:
+        while True:
+            while len(futures) < max_in_flight:
+                sacred_dir = next(sacred_dirs, None)
+                if sacred_dir is None:
+                    break
+                futures.append((sacred_dir, executor.submit(load_fn, sacred_dir)))
+            if not futures:
+                break
+
+            sacred_dir, future = futures.popleft()
+            try:
+                sd = future.result()
+            except json.JSONDecodeError:
+                invalid_dirs.append(sacred_dir)
+                continue
 
-    if run_name is not None:
-        sacred_dicts = filter(
-            lambda sd: get(sd.run, "experiment.name") == run_name, sacred_dicts
-        )
+            # Evaluate all selection predicates at once, cheapest and most selective
+            # first.
+            if (
+                (not skip_failed_runs or _run_status(sd.run) != "FAILED")
+                and (run_name is None or _run_exp_name(sd.run) == run_name)
+                and (env_name is None or _config_env_name(sd.config) == env_name)
+            ):
+                yield sd
+    finally:
+        # If the caller stops early, don't block on loads nobody will consume.
+        for _, future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+        # Warn once, rather than per directory, in case many are corrupt.
+        if invalid_dirs:
+            logging.debug(f"Sacred dirs with invalid JSON files: {invalid_dirs}")
+            shown = ", ".join(invalid_dirs[:5])
+            if len(invalid_dirs) > 5:
+                shown += ", ..."
+            warnings.warn(
+                f"Invalid JSON files in {len(invalid_dirs)} Sacred dirs: {shown}",
+                RuntimeWarning,
+            )
 
-    if env_name is not None:
-        sacred_dicts = filter(
-            lambda sd: get(sd.config, "env_name") == env_name, sacred_dicts
-        )
 
-    if skip_failed_runs:
-        sacred_dicts = filter(
-            lambda sd: get(sd.run, "status") != "FAILED", sacred_dicts
-        )
+# "tb" is TensorBoard directory built by our codebase. "sb_tb" is Stable
+# Baselines TensorBoard directory. There should be at most one of each
+# directory per run.
+_TB_BASENAMES = ("rl", "tb", "sb_tb")
 
-    return list(sacred_dicts)
+
+def _find_tb_dirs(run_dir: str) -> Dict[str, List[str]]:
+    """Finds TensorBoard directories inside `run_dir` with a single tree walk.
+
+    Like `sacred_util.filter_subdirs`, does not follow symlinks. Uses `os.scandir`
+    directly so each entry's type comes from the cached `DirEntry` and only its
+    basename is compared.
+
+    Args:
+        run_dir: The directory to search recursively.
+
+    Returns:
+        A dict mapping each basename in `_TB_BASENAMES` to a list of all
+        subdirectories of `run_dir` (including `run_dir` itself) with that basename.
+    """
+    tb_dirs = {basename: [] for basename in _TB_BASENAMES}
+    if osp.basename(run_dir) in tb_dirs:
+        tb_dirs[osp.basename(run_dir)].append(run_dir)
+
+    stack = [run_dir]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                subdirs = [e for e in it if e.is_dir(follow_symlinks=False)]
+        except OSError:
+            continue  # Ignore unreadable directories, as `os.walk` does.
+        for entry in subdirs:
+            if entry.name in tb_dirs:
+                tb_dirs[entry.name].append(entry.path)
+            stack.append(entry.path)
+    return tb_dirs
 
 
 @analysis_ex.command
@@ -75,7 +170,7 @@ def gather_tb_directories() -> dict:
     The directories are copied to a unique directory in `/tmp/analysis_tb/` under
     subdirectories matching the Tensorboard events' Ray Tune trial names.
 
-    This function calls the helper `_gather_sacred_dicts`, which captures its arguments
+    This function calls the helper `_iter_sacred_dicts`, which captures its arguments
     automatically via Sacred. Provide those arguments to select which Sacred
     results to parse.
 
@@ -89,24 +184,21 @@ def gather_tb_directories() -> dict:
     os.makedirs("/tmp/analysis_tb", exist_ok=True)
     tmp_dir = tempfile.mkdtemp(dir="/tmp/analysis_tb/")
 
+    # Expecting Sacred paths like "~/ray_results/{run_name}/sacred/1".
+    # Want to search for all Tensorboard dirs inside "~/ray_results/{run_name}".
+    # Several Sacred directories may share a run directory, so deduplicate (in
+    # order) to walk each run directory only once.
+    run_dirs = OrderedDict.fromkeys(
+        osp.dirname(osp.dirname(sd.sacred_dir.rstrip("/")))
+        for sd in _iter_sacred_dicts()
+    )
+
     tb_dirs_count = 0
-    for sd in _gather_sacred_dicts():
-        # Expecting a path like "~/ray_results/{run_name}/sacred/1".
-        # Want to search for all Tensorboard dirs inside
-        # "~/ray_results/{run_name}".
-        sacred_dir = sd.sacred_dir.rstrip("/")
-        run_dir = osp.dirname(osp.dirname(sacred_dir))
+    for run_dir in run_dirs:
         run_name = osp.basename(run_dir)
-
-        # "tb" is TensorBoard directory built by our codebase. "sb_tb" is Stable
-        # Baselines TensorBoard directory. There should be at most one of each
-        # directory.
-        for basename in ["rl", "tb", "sb_tb"]:
-            tb_src_dirs = tuple(
-                sacred_util.filter_subdirs(
-                    run_dir, lambda path: osp.basename(path) == basename
-                )
-            )
+        tb_dirs = _find_tb_dirs(run_dir)
+        for basename in _TB_BASENAMES:
+            tb_src_dirs = tb_dirs[basename]
             if tb_src_dirs:
                 assert len(tb_src_dirs) == 1, "expect at most one TB dir of each type"
                 tb_src_dir = tb_src_dirs[0]
@@ -127,42 +219,52 @@ def _get_exp_command(sd: sacred_util.SacredDicts) -> str:
     return str(sd.run.get("command"))
 
 
-def _get_algo_name(sd: sacred_util.SacredDicts) -> str:
-    exp_command = _get_exp_command(sd)
+def _get_adversarial_algo_name(sd: sacred_util.SacredDicts) -> Optional[str]:
+    algo = _config_algorithm(sd.config)
+    if algo is not None:
+        algo = algo.upper()
+    return algo
+
 
-    if exp_command == "train_adversarial":
-        algo = get(sd.config, "algorithm")
-        if algo is not None:
-            algo = algo.upper()
-        return algo
-    elif exp_command == "train_bc":
-        return "BC"
-    elif exp_command == "train_dagger":
-        return "DAgger"
-    else:
+# Maps each experiment command to a function returning the algorithm name.
+_algo_name_fns: Mapping[str, Callable[[sacred_util.SacredDicts], Optional[str]]] = {
+    "train_adversarial": _get_adversarial_algo_name,
+    "train_bc": lambda sd: "BC",
+    "train_dagger": lambda sd: "DAgger",
+}
+
+
+def _get_algo_name(sd: sacred_util.SacredDicts) -> Optional[str]:
+    exp_command = _get_exp_command(sd)
+    algo_name_fn = _algo_name_fns.get(exp_command)
+    if algo_name_fn is None:
         return f"??exp_command={exp_command}"
+    return algo_name_fn(sd)
 
 
 def _return_summaries(sd: sacred_util.SacredDicts) -> dict:
-    imit_stats = get(sd.run, "result.imit_stats")
-    expert_stats = get(sd.run, "result.expert_stats")
+    imit_stats = _run_imit_stats(sd.run)
+    expert_stats = _run_expert_stats(sd.run)
 
     expert_return_summary = None
-    if expert_stats is not None:
-        expert_return_summary = _make_return_summary(expert_stats)
-
     imit_return_summary = None
+    imit_expert_ratio = None
+    if expert_stats is not None:
+        expert_return_summary = (
+            f"{expert_stats['return_mean']:3g} ± {expert_stats['return_std']:3g} "
+            f"(n={expert_stats['n_traj']})"
+        )
     if imit_stats is not None:
-        imit_return_summary = _make_return_summary(imit_stats, "monitor_")
-
-    if imit_stats is not None and expert_stats is not None:
-        # Assuming here that `result.imit_stats` and `result.expert_stats` are
-        # formatted correctly.
-        imit_expert_ratio = (
-            imit_stats["monitor_return_mean"] / expert_stats["return_mean"]
+        imit_return_summary = (
+            f"{imit_stats['monitor_return_mean']:3g} ± "
+            f"{imit_stats['monitor_return_std']:3g} (n={imit_stats['n_traj']})"
         )
-    else:
-        imit_expert_ratio = None
+        if expert_stats is not None:
+            # Assuming here that `result.imit_stats` and `result.expert_stats` are
+            # formatted correctly.
+            imit_expert_ratio = (
+                imit_stats["monitor_return_mean"] / expert_stats["return_mean"]
+            )
 
     return dict(
         expert_stats=expert_stats,
@@ -173,27 +275,26 @@ def _return_summaries(sd: sacred_util.SacredDicts) -> dict:
     )
 
 
-sd_to_table_entry_type = Mapping[str, Callable[[sacred_util.SacredDicts], Any]]
+sd_to_table_entry_type = Mapping[
+    str, Callable[[sacred_util.SacredDicts, Mapping[str, Any]], Any]
+]
 
 # This OrderedDict maps column names to functions that get table entries, given the
-# row's unique SacredDicts object.
+# row's unique SacredDicts object and its precomputed `_return_summaries` dict.
 table_entry_fns: sd_to_table_entry_type = collections.OrderedDict(
     [
-        ("status", lambda sd: get(sd.run, "status")),
-        ("exp_command", _get_exp_command),
-        ("algo", _get_algo_name),
-        ("env_name", lambda sd: get(sd.config, "env_name")),
-        ("n_expert_demos", lambda sd: get(sd.config, "n_expert_demos")),
-        ("run_name", lambda sd: get(sd.run, "experiment.name")),
+        ("status", lambda sd, summaries: _run_status(sd.run)),
+        ("exp_command", lambda sd, summaries: _get_exp_command(sd)),
+        ("algo", lambda sd, summaries: _get_algo_name(sd)),
+        ("env_name", lambda sd, summaries: _config_env_name(sd.config)),
+        ("n_expert_demos", lambda sd, summaries: _config_n_expert_demos(sd.config)),
+        ("run_name", lambda sd, summaries: _run_exp_name(sd.run)),
         (
             "expert_return_summary",
-            lambda sd: _return_summaries(sd)["expert_return_summary"],
+            lambda sd, summaries: summaries["expert_return_summary"],
         ),
-        (
-            "imit_return_summary",
-            lambda sd: _return_summaries(sd)["imit_return_summary"],
-        ),
-        ("imit_expert_ratio", lambda sd: _return_summaries(sd)["imit_expert_ratio"]),
+        ("imit_return_summary", lambda sd, summaries: summaries["imit_return_summary"]),
+        ("imit_expert_ratio", lambda sd, summaries: summaries["imit_expert_ratio"]),
     ]
 )
 
@@ -224,18 +325,33 @@ table_verbosity_mapping.append(
 )
 
 
+# `_table_entry_fns_subsets[v]` holds the columns used at verbosity `v`. The last
+# entry is all of `table_entry_fns`, used for any verbosity past the mapping's end.
+_table_entry_fns_subsets: List[sd_to_table_entry_type] = [
+    OrderedDict((k, v) for k, v in table_entry_fns.items() if k in keys_subset)
+    for keys_subset in table_verbosity_mapping
+] + [table_entry_fns]
+
+
 def _get_table_entry_fns_subset(table_verbosity: int) -> sd_to_table_entry_type:
     assert table_verbosity >= 0
-    if table_verbosity >= len(table_verbosity_mapping):
-        return table_entry_fns
-    else:
-        keys_subset = table_verbosity_mapping[table_verbosity]
-        result = OrderedDict()
-        for k, v in table_entry_fns.items():
-            if k not in keys_subset:
-                continue
-            result[k] = v
-        return result
+    return _table_entry_fns_subsets[
+        min(table_verbosity, len(_table_entry_fns_subsets) - 1)
+    ]
+
+
+def _sort_table(df: pd.DataFrame) -> None:
+    """Sorts `df` in place by "algo" then "env_name", skipping if already sorted."""
+    if len(df) <= 1:
+        return
+    keys = df[["algo", "env_name"]]
+    # `MultiIndex` ordering of missing values differs from `sort_values`, which puts
+    # them last, so always sort when any are present.
+    if (
+        keys.isna().values.any()
+        or not pd.MultiIndex.from_frame(keys).is_monotonic_increasing
+    ):
+        df.sort_values(by=["algo", "env_name"], inplace=True)
 
 
 @analysis_ex.command
@@ -247,7 +363,7 @@ def analyze_imitation(
 ) -> pd.DataFrame:
     """Parse Sacred logs and generate a DataFrame for imitation learning results.
 
-    This function calls the helper `_gather_sacred_dicts`, which captures its arguments
+    This function calls the helper `_iter_sacred_dicts`, which captures its arguments
     automatically via Sacred. Provide those arguments to select which Sacred
     results to parse.
 
@@ -263,16 +379,15 @@ def analyze_imitation(
     """
     table_entry_fns_subset = _get_table_entry_fns_subset(table_verbosity)
 
-    rows = []
-    for sd in _gather_sacred_dicts():
-        row = OrderedDict()
+    # Build the table column-wise, so pandas doesn't have to infer columns per row.
+    columns = OrderedDict((col_name, []) for col_name in table_entry_fns_subset)
+    for sd in _iter_sacred_dicts():
+        summaries = _return_summaries(sd)
         for col_name, make_entry_fn in table_entry_fns_subset.items():
-            row[col_name] = make_entry_fn(sd)
-        rows.append(row)
+            columns[col_name].append(make_entry_fn(sd, summaries))
 
-    df = pd.DataFrame(rows)
-    if len(df) > 0:
-        df.sort_values(by=["algo", "env_name"], inplace=True)
+    df = pd.DataFrame(columns)
+    _sort_table(df)
 
     display_options = dict(index=False)
     if csv_output_path is not None:
@@ -289,12 +404,6 @@ def analyze_imitation(
     return df
 
 
-def _make_return_summary(stats: dict, prefix="") -> str:
-    return "{:3g} ± {:3g} (n={})".format(
-        stats[f"{prefix}return_mean"], stats[f"{prefix}return_std"], stats["n_traj"]
-    )
-
-
 def main_console():
     observer = FileStorageObserver(osp.join("output", "sacred", "analyze"))
     analysis_ex.observers.append(observer)
@@ -7,12 +7,14 @@ experiment implicitly sets parallel=False.
 
 import collections
 import filecmp
+import json
 import os
 import pathlib
 import shutil
 import subprocess
 import sys
 import tempfile
+import warnings
 from collections import Counter
 from typing import List, Optional
 from unittest import mock
@@ -32,6 +34,7 @@ from imitation.scripts import (
     train_dagger,
     train_preference_comparisons,
 )
+from imitation.util import sacred as sacred_util
 
 ALL_SCRIPTS_MODS = [
     analyze,
@@ -502,6 +505,175 @@ def test_analyze_gather_tb(tmpdir: str):
     assert run.result["n_tb_dirs"] == 2
 
 
+def _write_sacred_dir(sacred_dir: pathlib.Path, run: dict, config: dict) -> None:
+    """Writes a minimal Sacred FileObserver directory with `run` and `config`."""
+    sacred_dir.mkdir(parents=True)
+    (sacred_dir / "run.json").write_text(json.dumps(run))
+    (sacred_dir / "config.json").write_text(json.dumps(config))
+
+
+def test_analyze_gather_tb_shared_run_dir(tmpdir: str):
+    """Sacred dirs sharing a run dir are symlinked once, under the needed types only."""
+    run_dir = pathlib.Path(tmpdir, "run_dir")
+    for sacred_id in ["1", "2"]:
+        _write_sacred_dir(
+            run_dir / "sacred" / sacred_id,
+            run=dict(status="COMPLETED", command="train_bc"),
+            config=dict(env_name="CartPole-v1"),
+        )
+    (run_dir / "output" / "tb").mkdir(parents=True)
+
+    run = analyze.analysis_ex.run(
+        command_name="gather_tb_directories",
+        config_updates=dict(source_dirs=[tmpdir]),
+    )
+    assert run.status == "COMPLETED"
+    assert run.result["n_tb_dirs"] == 1
+    gather_dir = pathlib.Path(run.result["gather_dir"])
+    assert sorted(os.listdir(gather_dir)) == ["tb"]
+    assert os.listdir(gather_dir / "tb") == ["run_dir"]
+
+
+def test_analyze_imitation_tex_output(tmpdir: str):
+    """The TeX table is written with rows sorted by algorithm, then environment."""
+    tmpdir = pathlib.Path(tmpdir)
+    runs = [
+        ("train_adversarial", "Env-a"),
+        ("train_bc", "Env-b"),
+        ("train_bc", "Env-a"),
+    ]
+    for i, (command, env_name) in enumerate(runs):
+        _write_sacred_dir(
+            tmpdir / "sacred" / str(i),
+            run=dict(status="COMPLETED", command=command),
+            config=dict(env_name=env_name, algorithm="gail"),
+        )
+
+    tex_path = tmpdir / "analysis.tex"
+    run = analyze.analysis_ex.run(
+        command_name="analyze_imitation",
+        config_updates=dict(
+            source_dirs=[tmpdir / "sacred"],
+            tex_output_path=tex_path,
+            print_table=False,
+            table_verbosity=0,
+        ),
+    )
+    assert run.status == "COMPLETED"
+    assert tex_path.exists()
+
+    lines = tex_path.read_text().splitlines()
+    body = lines[lines.index("\\midrule") + 1 : lines.index("\\bottomrule")]
+    # With `table_verbosity=0`, "algo" and "env_name" are the first two columns.
+    keys = [tuple(cell.strip() for cell in line.split("&")[:2]) for line in body]
+    assert keys == [("BC", "Env-a"), ("BC", "Env-b"), ("GAIL", "Env-a")]
+
+
+@pytest.mark.parametrize(
+    "d,nested_key",
+    [
+        ({"status": "COMPLETED"}, "status"),  # Present value.
+        ({"result": {"imit_stats": {"n_traj": 3}}}, "result.imit_stats"),
+        ({"result": {"imit_stats": None}}, "result.imit_stats"),  # Present None.
+        ({}, "status"),  # Missing key.
+        ({"result": {}}, "result.imit_stats"),  # Missing nested key.
+        ({"result": None}, "result.imit_stats"),  # None intermediate.
+        ({"result": "failed"}, "result.imit_stats"),  # Non-dict intermediate.
+        ({"result": [1, 2]}, "result.imit_stats"),
+    ],
+)
+def test_analyze_path_getter_matches_dict_get_nested(d, nested_key):
+    getter = analyze._path_getter(*nested_key.split("."))
+    assert getter(d) == sacred_util.dict_get_nested(d, nested_key)
+
+
+@pytest.mark.parametrize(
+    "algo,env_name",
+    [
+        (["AIRL", "BC", "BC"], ["Env-a", "Env-a", "Env-b"]),  # Already sorted.
+        (["BC", "AIRL", "BC"], ["Env-b", "Env-a", "Env-a"]),  # Unsorted.
+        (["BC", None, "AIRL"], ["Env-a", "Env-b", "Env-a"]),  # Missing value.
+        (["BC"], ["Env-a"]),  # Single row.
+    ],
+)
+def test_analyze_sort_table(algo, env_name):
+    df = pd.DataFrame(
+        collections.OrderedDict(
+            algo=algo, env_name=env_name, row_id=list(range(len(algo)))
+        )
+    )
+    expected = df.sort_values(by=["algo", "env_name"])
+    analyze._sort_table(df)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_analyze_imitation_invalid_json(tmpdir: str):
+    tmpdir = pathlib.Path(tmpdir)
+    for sacred_id in ["1", "2"]:
+        _write_sacred_dir(
+            tmpdir / "sacred" / sacred_id,
+            run=dict(status="COMPLETED", command="train_bc"),
+            config=dict(env_name="CartPole-v1"),
+        )
+    (tmpdir / "sacred" / "2" / "run.json").write_text("{not valid json")
+
+    with warnings.catch_warnings(record=True) as record:
+        warnings.simplefilter("always")
+        run = analyze.analysis_ex.run(
+            command_name="analyze_imitation",
+            config_updates=dict(source_dirs=[tmpdir / "sacred"], print_table=False),
+        )
+    assert run.status == "COMPLETED"
+    assert len(run.result) == 1
+    json_warnings = [
+        w
+        for w in record
+        if issubclass(w.category, RuntimeWarning) and "Invalid JSON" in str(w.message)
+    ]
+    assert len(json_warnings) == 1
+    assert str(tmpdir / "sacred" / "2") in str(json_warnings[0].message)
+
+
+def test_find_tb_dirs(tmpdir: str):
+    run_dir = pathlib.Path(tmpdir, "run")
+    (run_dir / "output" / "rl" / "tb").mkdir(parents=True)
+    (run_dir / "output" / "sb_tb").mkdir(parents=True)
+    # Symlinks are not followed, so neither of these should be found.
+    elsewhere = pathlib.Path(tmpdir, "elsewhere")
+    (elsewhere / "rl").mkdir(parents=True)
+    (run_dir / "tb").symlink_to(elsewhere, target_is_directory=True)
+    (run_dir / "link").symlink_to(elsewhere, target_is_directory=True)
+
+    tb_dirs = analyze._find_tb_dirs(str(run_dir))
+    assert tb_dirs == {
+        "rl": [str(run_dir / "output" / "rl")],
+        "tb": [str(run_dir / "output" / "rl" / "tb")],
+        "sb_tb": [str(run_dir / "output" / "sb_tb")],
+    }
+
+
+def test_find_tb_dirs_root_is_tb(tmpdir: str):
+    run_dir = pathlib.Path(tmpdir, "tb")
+    (run_dir / "sub").mkdir(parents=True)
+    tb_dirs = analyze._find_tb_dirs(str(run_dir))
+    assert tb_dirs == {"rl": [], "tb": [str(run_dir)], "sb_tb": []}
+
+
+def test_find_tb_dirs_unreadable_subdir(tmpdir: str):
+    run_dir = pathlib.Path(tmpdir, "run")
+    locked_dir = run_dir / "locked"
+    (locked_dir / "tb").mkdir(parents=True)
+    (run_dir / "sb_tb").mkdir()
+    locked_dir.chmod(0)
+    try:
+        if os.access(locked_dir, os.R_OK):
+            pytest.skip("Permissions are not enforced (e.g. running as root).")
+        tb_dirs = analyze._find_tb_dirs(str(run_dir))
+    finally:
+        locked_dir.chmod(0o755)
+    assert tb_dirs == {"rl": [], "tb": [], "sb_tb": [str(run_dir / "sb_tb")]}
+
+
 def test_convert_trajs_in_place(tmpdir: str):
     shutil.copy(CARTPOLE_TEST_ROLLOUT_PATH, tmpdir)
     tmp_path = os.path.join(tmpdir, os.path.basename(CARTPOLE_TEST_ROLLOUT_PATH))